@@ -0,0 +1,255 @@
+"""Buffered access audit log
+
+Requests record who created or viewed which consultations by putting events
+into a bounded in-memory buffer; a background thread writes them to the
+append-only `access_audit_log` table in batches (one multi-row INSERT per
+batch). Requests therefore never wait on an audit write.
+
+If the database falls behind and the buffer fills, recording blocks for up
+to AUDIT_BACKPRESSURE_TIMEOUT_S and then fails the request, so records are
+never silently dropped. Batches that fail because the database is
+unreachable are retried until they succeed, and whatever is buffered is
+flushed on shutdown. A batch the database rejects for its content is split
+up, and events that still cannot be stored are logged to the
+`app.audit.dead_letter` logger, so one bad event never stalls the writer.
+
+Writes reserve their buffer space with `reserve()` before committing, so a
+full buffer fails the request before anything is saved, never after.
+"""
+from collections import namedtuple
+from datetime import date, datetime
+from sqlalchemy import insert, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from typing import Iterable, List, Optional, Set
+from app import models
+from app.database import create_dedicated_engine
+from app.exceptions import ServiceUnavailableException
+from app.logging_config import request_id_var
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+dead_letter_logger = logging.getLogger("app.audit.dead_letter")
+
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_MS = float(os.getenv("AUDIT_FLUSH_INTERVAL_MS", "200"))
+# Longest a request waits for buffer space before it is failed
+AUDIT_BACKPRESSURE_TIMEOUT_S = float(os.getenv("AUDIT_BACKPRESSURE_TIMEOUT_S", "2"))
+
+# Actions
+CREATE = "create"
+VIEW = "view"
+
+AuditEvent = namedtuple("AuditEvent", "occurred_at doctor_id action consultation_id request_id")
+
+def _partition_bounds(day: date):
+    """First day of the month containing `day` and of the following month"""
+    start = day.replace(day=1)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a failed write may succeed if retried (lost connection, database down)"""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (OperationalError, InterfaceError))
+
+def _reason(error: Exception) -> Exception:
+    """The driver's error, without the SQL and parameters SQLAlchemy adds"""
+    return getattr(error, "orig", None) or error
+
+def _events(doctor_id: int, action: str, consultation_ids: Iterable[int]) -> List[AuditEvent]:
+    now = datetime.utcnow()
+    request_id = request_id_var.get()
+    return [AuditEvent(now, doctor_id, action, consultation_id, request_id) for consultation_id in consultation_ids]
+
+class AuditReservation:
+    """Buffer space held for events that will be recorded after a commit"""
+    def __init__(self, log: "AuditLog", count: int):
+        self._log = log
+        self._remaining = count
+
+    def record(self, doctor_id: int, action: str, consultation_ids: Iterable[int]) -> None:
+        """Buffer events in the reserved space; never blocks or fails"""
+        self._put(_events(doctor_id, action, consultation_ids))
+
+    def _put(self, events: List[AuditEvent]) -> None:
+        if len(events) > self._remaining:
+            raise ValueError(f"Reserved space for {self._remaining} audit events, got {len(events)}")
+        self._remaining -= len(events)
+        for event in events:
+            self._log._queue.put(event)
+
+    def release(self) -> None:
+        """Give back any space that was not used"""
+        self._log._release(self._remaining)
+        self._remaining = 0
+
+    def __enter__(self) -> "AuditReservation":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+class AuditLog:
+    """Bounded event buffer with a background batch writer"""
+    def __init__(self, buffer_size: int = AUDIT_BUFFER_SIZE):
+        # The queue itself is unbounded; its size is limited by the free slots
+        self._queue: "queue.Queue[AuditEvent]" = queue.Queue()
+        self._slots = threading.Semaphore(buffer_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._engine: Optional[Engine] = None
+        self._partitions: Set[date] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def reserve(self, count: int) -> AuditReservation:
+        """
+        Hold buffer space for `count` events, blocking briefly if the buffer
+        is full and raising ServiceUnavailableException if it stays full
+        """
+        deadline = time.monotonic() + AUDIT_BACKPRESSURE_TIMEOUT_S
+        for acquired in range(count):
+            if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                self._release(acquired)
+                logger.error("Audit buffer full; rejecting request")
+                raise ServiceUnavailableException("Audit log is unavailable, please retry shortly")
+        return AuditReservation(self, count)
+
+    def record(self, doctor_id: int, action: str, consultation_ids: Iterable[int]) -> None:
+        """Buffer one event per consultation, blocking briefly if the buffer is full"""
+        events = _events(doctor_id, action, consultation_ids)
+        with self.reserve(len(events)) as reservation:
+            reservation._put(events)
+
+    def _release(self, count: int) -> None:
+        for _ in range(count):
+            self._slots.release()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._engine = create_dedicated_engine()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Flush everything buffered, then stop the writer"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._engine.dispose()
+        self._engine = None
+
+    def _run(self) -> None:
+        interval = AUDIT_FLUSH_INTERVAL_MS / 1000
+        while True:
+            stopping = self._stop.is_set()
+            batch = self._drain(timeout=0 if stopping else interval)
+            if batch:
+                self._write(batch)
+            elif stopping:
+                return
+
+    def _drain(self, timeout: float) -> List[AuditEvent]:
+        """
+        Wait up to `timeout` for a first event, then keep collecting until
+        the batch is full or `timeout` has passed since that event
+        """
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait())
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + timeout
+        while len(batch) < AUDIT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._release(len(batch))
+        return batch
+
+    def _write(self, batch: List[AuditEvent]) -> None:
+        """
+        Insert a batch, retrying transient failures with backoff until it is
+        stored and splitting it up if the database rejects it
+        """
+        delay = 0.5
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                with self._engine.begin() as connection:
+                    created = self._ensure_partitions(connection, batch)
+                    connection.execute(
+                        insert(models.AccessAuditLog),
+                        [event._asdict() for event in batch]
+                    )
+                self._partitions.update(created)
+                return
+            except Exception as e:
+                if not _is_transient(e):
+                    # Retrying cannot help; store the rest of the batch without
+                    # the offending events
+                    self._write_apart(batch, e)
+                    return
+                if self._stop.is_set() and attempts >= 3:
+                    # Shutting down with the database unreachable: leave the
+                    # events in the log rather than blocking shutdown forever
+                    self._dead_letter(batch, e)
+                    return
+                logger.error("Failed to write %d audit events, retrying: %s", len(batch), e)
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _write_apart(self, batch: List[AuditEvent], error: Exception) -> None:
+        """Write the halves of a rejected batch separately, down to single events"""
+        if len(batch) == 1:
+            self._dead_letter(batch, error)
+            return
+        logger.warning("Audit batch of %d events rejected, splitting it: %s", len(batch), _reason(error))
+        middle = len(batch) // 2
+        self._write(batch[:middle])
+        self._write(batch[middle:])
+
+    def _dead_letter(self, batch: List[AuditEvent], error: Exception) -> None:
+        for event in batch:
+            dead_letter_logger.error("Audit event not stored: %s (%s)", event._asdict(), _reason(error))
+
+    def _ensure_partitions(self, connection, batch: List[AuditEvent]) -> Set[date]:
+        """Create the monthly partitions a batch needs (Postgres only)"""
+        created = set()
+        if connection.dialect.name != "postgresql":
+            return created
+        for start in {_partition_bounds(event.occurred_at.date())[0] for event in batch}:
+            if start in self._partitions:
+                continue
+            start, end = _partition_bounds(start)
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS access_audit_log_{start:%Y_%m} "
+                f"PARTITION OF access_audit_log "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            created.add(start)
+        return created
+
+audit_log = AuditLog()
+
+def record(doctor_id: int, action: str, consultation_ids: Iterable[int]) -> None:
+    audit_log.record(doctor_id, action, consultation_ids)
+
+def reserve(count: int) -> AuditReservation:
+    return audit_log.reserve(count)
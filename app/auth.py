@@ -21,7 +21,6 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    print("password")
     if len(password.encode("utf-8")) > 72:
         password = sha256(password.encode("utf-8")).hexdigest()
     return pwd_context.hash(password)
@@ -0,0 +1,289 @@
+"""Shared, memory-mapped diagnosis code catalog
+
+The diagnosis code list is small and effectively read-only. Rather than have
+every worker hold its own copy as ORM objects, it is written once to a
+compact binary snapshot which each worker maps read-only. All workers then
+share the same physical pages, and lookups read straight from the mapping.
+
+Snapshot layout (native byte order, recorded in the magic):
+
+    header      magic[8] version:u64 count:u32 text_len:u32 search_len:u32 crc32:u32
+    ids         int32[count]            sorted by code
+    code_off    uint32[count + 1]       start of each record (its code) in text
+    desc_off    uint32[count]           start of each record's description in text
+    search_off  uint32[count + 1]       offsets of each record in search
+    text        UTF-8 codes and descriptions
+    search      lowercased "code\\0description\\n" per record, for substring search
+
+Build it with `python -m app.catalog build` (the Gunicorn master does this
+before starting workers).
+"""
+from array import array
+from bisect import bisect_right
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from app import models, invalidation
+from app.database import SessionLocal
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "/tmp/clinic-diagnosis-catalog.bin")
+# Set by the Gunicorn master once it has built a fresh snapshot for its workers
+CATALOG_SNAPSHOT_PREBUILT = os.getenv("CATALOG_SNAPSHOT_PREBUILT", "") == "1"
+
+MAGIC = b"DXCAT1" + (b"LE" if sys.byteorder == "little" else b"BE")
+HEADER = struct.Struct("=8sQIIII")
+
+class DiagnosisEntry:
+    """A single diagnosis code, as returned by catalog lookups"""
+    __slots__ = ("id", "code", "description")
+
+    def __init__(self, id: int, code: str, description: str):
+        self.id = id
+        self.code = code
+        self.description = description
+
+    @classmethod
+    def from_model(cls, row: models.DiagnosisCode) -> "DiagnosisEntry":
+        return cls(row.id, row.code, row.description)
+
+class CatalogSnapshot:
+    """Read-only, array-backed view over a mapped snapshot file"""
+    __slots__ = (
+        "version", "count", "_mm", "_ids", "_code_off", "_desc_off",
+        "_search_off", "_text", "_search"
+    )
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.count, text_len, search_len, crc = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f"Not a diagnosis catalog snapshot for this platform: {path}")
+
+        view = memoryview(self._mm)
+        position = HEADER.size
+        if zlib.crc32(view[position:]) != crc:
+            raise ValueError(f"Diagnosis catalog snapshot is corrupt: {path}")
+
+        def take(nbytes: int) -> memoryview:
+            nonlocal position
+            section = view[position:position + nbytes]
+            position += nbytes
+            return section
+
+        self._ids = take(4 * self.count).cast("i")
+        self._code_off = take(4 * (self.count + 1)).cast("I")
+        self._desc_off = take(4 * self.count).cast("I")
+        self._search_off = take(4 * (self.count + 1)).cast("I")
+        self._text = take(text_len)
+        self._search = take(search_len)
+
+    def _code_bytes(self, index: int) -> bytes:
+        return bytes(self._text[self._code_off[index]:self._desc_off[index]])
+
+    def entry(self, index: int) -> DiagnosisEntry:
+        description = self._text[self._desc_off[index]:self._code_off[index + 1]]
+        return DiagnosisEntry(
+            self._ids[index],
+            self._code_bytes(index).decode("utf-8"),
+            bytes(description).decode("utf-8")
+        )
+
+    def find(self, code: str) -> Optional[DiagnosisEntry]:
+        """Binary search for an exact code"""
+        target = code.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._code_bytes(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._code_bytes(low) == target:
+            return self.entry(low)
+        return None
+
+    def search(self, term: str, limit: int) -> List[DiagnosisEntry]:
+        """Case-insensitive substring match on code or description, in code order"""
+        needle = term.lower().encode("utf-8")
+        if not needle or b"\0" in needle or b"\n" in needle:
+            return []
+        matches = []
+        seen = set()
+        position = self._find(needle, 0)
+        while position != -1 and len(matches) < limit:
+            index = bisect_right(self._search_off, position) - 1
+            # Ignore matches that run past the end of their record
+            if position + len(needle) < self._search_off[index + 1] and index not in seen:
+                seen.add(index)
+                matches.append(index)
+            position = self._find(needle, position + 1)
+        return [self.entry(index) for index in sorted(matches)]
+
+    def _find(self, needle: bytes, start: int) -> int:
+        base = len(self._mm) - len(self._search)
+        position = self._mm.find(needle, base + start)
+        return -1 if position == -1 else position - base
+
+def build_snapshot(db: Session, path: str = CATALOG_SNAPSHOT_PATH, version: Optional[int] = None) -> int:
+    """Write a snapshot of diagnosis_codes to `path` atomically, returning its version"""
+    rows = db.query(models.DiagnosisCode).all()
+    rows.sort(key=lambda row: row.code.encode("utf-8"))
+    version = version if version is not None else time.time_ns() // 1000
+
+    ids = array("i")
+    code_off, desc_off, search_off = array("I"), array("I"), array("I")
+    text, search = bytearray(), bytearray()
+    for row in rows:
+        code = row.code.encode("utf-8")
+        description = row.description.encode("utf-8")
+        ids.append(row.id)
+        code_off.append(len(text))
+        text += code
+        desc_off.append(len(text))
+        text += description
+        search_off.append(len(search))
+        search += f"{row.code}\0{row.description}\n".lower().encode("utf-8")
+    code_off.append(len(text))
+    search_off.append(len(search))
+
+    body = b"".join([
+        ids.tobytes(), code_off.tobytes(), desc_off.tobytes(), search_off.tobytes(),
+        bytes(text), bytes(search)
+    ])
+    header = HEADER.pack(MAGIC, version, len(rows), len(text), len(search), zlib.crc32(body))
+
+    # Write then rename, so workers mapping the old file keep a consistent view
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    logger.info("Wrote diagnosis catalog snapshot v%d with %d codes to %s", version, len(rows), path)
+    return version
+
+def read_snapshot_version(path: str = CATALOG_SNAPSHOT_PATH) -> Optional[int]:
+    """Version of the snapshot on disk, or None if there is no readable one"""
+    try:
+        with open(path, "rb") as f:
+            magic, version, *_ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return version if magic == MAGIC else None
+
+class DiagnosisCatalog:
+    """The current snapshot for this process; None until loaded"""
+    def __init__(self, path: str = CATALOG_SNAPSHOT_PATH):
+        self.path = path
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def version(self) -> Optional[int]:
+        snapshot = self._snapshot
+        return snapshot.version if snapshot else None
+
+    def load(self, db: Session, min_version: Optional[int] = None, rebuild: bool = False) -> int:
+        """
+        Map the snapshot on disk, first rebuilding it from `db` if asked to,
+        if it is missing or unreadable, or if it is older than `min_version`.
+        Returns the number of codes.
+        """
+        # The file lock stops several workers rebuilding the same snapshot
+        with open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            on_disk = read_snapshot_version(self.path)
+            stale = on_disk is None or (min_version is not None and on_disk < min_version)
+            snapshot = None
+            if not (rebuild or stale):
+                try:
+                    snapshot = CatalogSnapshot(self.path)
+                except (OSError, ValueError) as e:
+                    logger.warning("Rebuilding unreadable diagnosis catalog snapshot: %s", e)
+            if snapshot is None:
+                build_snapshot(db, self.path, version=max(min_version or 0, time.time_ns() // 1000))
+                snapshot = CatalogSnapshot(self.path)
+
+        with self._lock:
+            # The previous mapping is released once no request still uses it
+            self._snapshot = snapshot
+        logger.info("Diagnosis catalog v%d mapped with %d codes", snapshot.version, snapshot.count)
+        return snapshot.count
+
+    def invalidate(self) -> None:
+        """Drop the catalog so lookups fall back to the database"""
+        with self._lock:
+            self._snapshot = None
+
+    def get(self, code: str) -> Optional[DiagnosisEntry]:
+        snapshot = self._snapshot
+        return snapshot.find(code) if snapshot else None
+
+    def search(self, term: str, limit: int) -> List[DiagnosisEntry]:
+        snapshot = self._snapshot
+        return snapshot.search(term, limit) if snapshot else []
+
+    def first(self) -> Optional[DiagnosisEntry]:
+        snapshot = self._snapshot
+        return snapshot.entry(0) if snapshot and snapshot.count else None
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        return snapshot.count if snapshot else 0
+
+diagnosis_catalog = DiagnosisCatalog()
+
+def _on_catalog_changed(version: Optional[str]) -> None:
+    """Map the newer snapshot another process announced, rebuilding it if needed"""
+    db = SessionLocal()
+    try:
+        if version is None:
+            # Events may have been missed, so the snapshot on disk may be stale too
+            diagnosis_catalog.load(db, rebuild=True)
+        else:
+            diagnosis_catalog.load(db, min_version=int(version))
+    except Exception:
+        # Lookups fall back to the database until the next successful load
+        diagnosis_catalog.invalidate()
+        raise
+    finally:
+        db.close()
+
+invalidation.subscribe(invalidation.CATALOG_CHANGED, _on_catalog_changed)
+
+if __name__ == "__main__":
+    # `python -m app.catalog build` writes a fresh snapshot;
+    # `python -m app.catalog publish` also tells running workers to map it
+    if len(sys.argv) != 2 or sys.argv[1] not in ("build", "publish"):
+        sys.exit("usage: python -m app.catalog {build,publish}")
+    if sys.argv[1] == "publish" and not invalidation.bus.broadcasts:
+        sys.exit(
+            f"INVALIDATION_BUS is {invalidation.INVALIDATION_BUS!r}, so no running worker "
+            "would receive the new version"
+        )
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        new_version = build_snapshot(db)
+    finally:
+        db.close()
+    if sys.argv[1] == "publish":
+        invalidation.publish(invalidation.CATALOG_CHANGED, new_version)
@@ -1,20 +1,27 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.orm import Session, defer, joinedload, load_only, selectinload, with_expression
+from sqlalchemy import or_, func, select
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from app import models, schemas, auth
+from app import models, schemas, auth, invalidation
+from app.catalog import diagnosis_catalog, DiagnosisEntry
+from app.group_commit import GroupCommitWriter, WriterNotRunning
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from app.exceptions import DatabaseException, NotFoundException, DuplicateException
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+# Characters of notes returned by the consultation summary list
+NOTES_PREVIEW_LENGTH = 200
+
 # Doctor CRUD
 def get_doctor_by_email(db: Session, email: str) -> Optional[models.Doctor]:
     """Get a doctor by email"""
     try:
         return db.query(models.Doctor).filter(models.Doctor.email == email).first()
     except SQLAlchemyError as e:
-        logger.error(f"Database error getting doctor by email: {str(e)}")
+        logger.error("Database error getting doctor by email: %s", e)
         raise DatabaseException("Failed to retrieve doctor information")
 
 def create_doctor(db: Session, doctor: schemas.DoctorCreate) -> models.Doctor:
@@ -25,8 +32,6 @@ def create_doctor(db: Session, doctor: schemas.DoctorCreate) -> models.Doctor:
         if existing_doctor:
             raise DuplicateException(f"Doctor with email {doctor.email} already exists")
 
-        print(0, f"here's the password {doctor.password}")
-        
         hashed_password = auth.get_password_hash(doctor.password)
         db_doctor = models.Doctor(
             email=doctor.email,
@@ -36,17 +41,18 @@ def create_doctor(db: Session, doctor: schemas.DoctorCreate) -> models.Doctor:
         db.add(db_doctor)
         db.commit()
         db.refresh(db_doctor)
+        invalidation.publish(invalidation.DOCTOR_CHANGED, db_doctor.id)
         return db_doctor
     except DuplicateException:
         db.rollback()
         raise
     except IntegrityError as e:
         db.rollback()
-        logger.error(f"Integrity error creating doctor: {str(e)}")
+        logger.error("Integrity error creating doctor: %s", e)
         raise DuplicateException(f"Doctor with email {doctor.email} already exists")
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Database error creating doctor: {str(e)}")
+        logger.error("Database error creating doctor: %s", e)
         raise DatabaseException("Failed to create doctor account")
 
 def authenticate_doctor(db: Session, email: str, password: str) -> Optional[models.Doctor]:
@@ -61,17 +67,22 @@ def authenticate_doctor(db: Session, email: str, password: str) -> Optional[mode
             return None
         return doctor
     except SQLAlchemyError as e:
-        logger.error(f"Database error authenticating doctor: {str(e)}")
+        logger.error("Database error authenticating doctor: %s", e)
         raise DatabaseException("Authentication failed due to database error")
 
 # Diagnosis CRUD
-def search_diagnosis_codes(db: Session, search: str, limit: int = 50) -> List[models.DiagnosisCode]:
+def search_diagnosis_codes(db: Session, search: str, limit: int = 50) -> List[DiagnosisEntry]:
     """Search diagnosis codes by code or description"""
     try:
         if not search or not search.strip():
             return []
         
-        search_pattern = f"%{search.strip()}%"
+        search = search.strip()
+        # The catalog matches literally, so leave ILIKE wildcards to the database
+        if diagnosis_catalog.loaded and "%" not in search and "_" not in search:
+            return diagnosis_catalog.search(search, limit)
+        
+        search_pattern = f"%{search}%"
         results = db.query(models.DiagnosisCode).filter(
             or_(
                 models.DiagnosisCode.code.ilike(search_pattern),
@@ -79,92 +90,272 @@ def search_diagnosis_codes(db: Session, search: str, limit: int = 50) -> List[mo
             )
         ).limit(limit).all()
         
-        return results
+        return [DiagnosisEntry.from_model(row) for row in results]
     except SQLAlchemyError as e:
-        logger.error(f"Database error searching diagnosis codes: {str(e)}")
+        logger.error("Database error searching diagnosis codes: %s", e)
         raise DatabaseException("Failed to search diagnosis codes")
 
-def get_diagnosis_code_by_code(db: Session, code: str) -> Optional[models.DiagnosisCode]:
+def get_diagnosis_code_by_code(db: Session, code: str) -> Optional[DiagnosisEntry]:
     """Get a single diagnosis code by its code string"""
     try:
         if not code or not code.strip():
             return None
         
-        return db.query(models.DiagnosisCode).filter(
-            models.DiagnosisCode.code == code.strip().upper()
+        code = code.strip().upper()
+        cached = diagnosis_catalog.get(code)
+        if cached is not None:
+            return cached
+        
+        row = db.query(models.DiagnosisCode).filter(
+            models.DiagnosisCode.code == code
         ).first()
+        return DiagnosisEntry.from_model(row) if row else None
     except SQLAlchemyError as e:
-        logger.error(f"Database error getting diagnosis code: {str(e)}")
+        logger.error("Database error getting diagnosis code: %s", e)
         raise DatabaseException("Failed to retrieve diagnosis code")
 
-# Consultation CRUD
-def create_consultation(
-    db: Session, 
-    consultation: schemas.ConsultationCreate, 
-    doctor_id: int
-) -> models.Consultation:
-    """Create a new consultation with associated diagnosis codes"""
+def resolve_diagnosis_codes(
+    db: Session,
+    codes: List[str]
+) -> Tuple[List[DiagnosisEntry], List[str]]:
+    """
+    Look up many diagnosis codes at once.
+    
+    Codes are normalised (stripped, uppercased) and de-duplicated in order.
+    Returns the entries that exist and the codes that do not. Codes missing
+    from the catalog are fetched with a single IN query.
+    """
     try:
-        # Validate all diagnosis codes exist before creating consultation
-        valid_codes = []
-        invalid_codes = []
-        
-        for code in consultation.diagnosis_codes:
-            diagnosis_code = get_diagnosis_code_by_code(db, code)
-            if diagnosis_code:
-                valid_codes.append(diagnosis_code)
+        normalised = list(dict.fromkeys(code.strip().upper() for code in codes if code and code.strip()))
+        
+        found = {}
+        missing = []
+        for code in normalised:
+            entry = diagnosis_catalog.get(code)
+            if entry is not None:
+                found[code] = entry
             else:
-                invalid_codes.append(code)
+                missing.append(code)
         
-        if invalid_codes:
-            raise NotFoundException(
-                f"Invalid diagnosis codes: {', '.join(invalid_codes)}. "
-                "Please ensure all codes exist in the system."
-            )
+        if missing:
+            rows = db.query(models.DiagnosisCode).filter(
+                models.DiagnosisCode.code.in_(missing)
+            ).all()
+            for row in rows:
+                found[row.code] = DiagnosisEntry.from_model(row)
         
-        # Create consultation
-        db_consultation = models.Consultation(
-            doctor_id=doctor_id,
-            patient_name=consultation.patient_name,
-            consultation_date=consultation.consultation_date,
-            notes=consultation.notes
+        return (
+            [found[code] for code in normalised if code in found],
+            [code for code in normalised if code not in found]
         )
-        db.add(db_consultation)
-        db.flush()  # Get the consultation ID
-        
-        # Add diagnosis codes
-        for diagnosis_code in valid_codes:
-            consultation_diagnosis = models.ConsultationDiagnosis(
-                consultation_id=db_consultation.id,
-                diagnosis_code_id=diagnosis_code.id
+    except SQLAlchemyError as e:
+        logger.error("Database error resolving diagnosis codes: %s", e)
+        raise DatabaseException("Failed to resolve diagnosis codes")
+
+# Patient CRUD
+def normalise_patient_name(name: str) -> str:
+    """
+    Key used to match a patient name: lowercased, punctuation removed and
+    whitespace collapsed, so "Doe,  John" and "doe john" match.
+    Must agree with patient_name_key() in init.sql.
+    """
+    key = " ".join(re.sub(r"[^\w\s]|_", "", name.lower()).split())
+    return key or name.strip().lower()
+
+def _add_patient(db: Session, doctor_id: int, name: str) -> models.Patient:
+    """Add a new patient for a doctor, without committing"""
+    patient = models.Patient(doctor_id=doctor_id, name=name, name_key=normalise_patient_name(name))
+    db.add(patient)
+    db.flush()
+    return patient
+
+def _patient_query(db: Session):
+    """Patient query that also loads each patient's consultation count and last visit"""
+    visits = models.Consultation.patient_id == models.Patient.id
+    return db.query(models.Patient).options(
+        with_expression(
+            models.Patient.consultation_count,
+            select(func.count(models.Consultation.id)).where(visits).scalar_subquery()
+        ),
+        with_expression(
+            models.Patient.last_visit,
+            select(func.max(models.Consultation.consultation_date)).where(visits).scalar_subquery()
+        )
+    )
+
+def search_patients(
+    db: Session,
+    search: str,
+    doctor_id: Optional[int] = None,
+    limit: int = 20
+) -> List[models.Patient]:
+    """
+    Search patients by name, optionally only one doctor's.
+    
+    Matches substrings of the normalised name and, on Postgres, similar
+    spellings through the trigram index, best matches first. Patients with
+    the same name are separate rows, so several may match.
+    """
+    try:
+        key = normalise_patient_name(search)
+        if not key:
+            return []
+        
+        escaped = key.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        substring = models.Patient.name_key.like(f"%{escaped}%", escape="\\")
+        query = _patient_query(db)
+        if doctor_id:
+            query = query.filter(models.Patient.doctor_id == doctor_id)
+        
+        if db.get_bind().dialect.name == "postgresql":
+            # `%` is pg_trgm's similarity operator; both conditions use the trigram index
+            query = query.filter(
+                or_(substring, models.Patient.name_key.bool_op("%")(key))
+            ).order_by(
+                func.similarity(models.Patient.name_key, key).desc(),
+                models.Patient.name_key
             )
-            db.add(consultation_diagnosis)
+        else:
+            query = query.filter(substring).order_by(models.Patient.name_key)
         
-        db.commit()
-        db.refresh(db_consultation)
-        return db_consultation
+        return query.limit(limit).all()
+    except SQLAlchemyError as e:
+        logger.error("Database error searching patients: %s", e)
+        raise DatabaseException("Failed to search patients")
+
+def get_patient(db: Session, patient_id: int, doctor_id: Optional[int] = None) -> models.Patient:
+    """Get a patient, optionally only if they are one doctor's"""
+    try:
+        query = _patient_query(db).filter(models.Patient.id == patient_id)
+        if doctor_id:
+            query = query.filter(models.Patient.doctor_id == doctor_id)
+        patient = query.first()
+    except SQLAlchemyError as e:
+        logger.error("Database error getting patient: %s", e)
+        raise DatabaseException("Failed to retrieve patient")
+    
+    if patient is None:
+        raise NotFoundException(f"Patient {patient_id} not found")
+    return patient
+
+# Consultation CRUD
+def _add_consultation(
+    db: Session,
+    consultation: schemas.ConsultationCreate,
+    doctor_id: int
+) -> models.Consultation:
+    """Validate and add a consultation with its diagnoses, without committing"""
+    # Validate all diagnosis codes exist before creating consultation
+    valid_codes, invalid_codes = resolve_diagnosis_codes(db, consultation.diagnosis_codes)
+    
+    if invalid_codes:
+        raise NotFoundException(
+            f"Invalid diagnosis codes: {', '.join(invalid_codes)}. "
+            "Please ensure all codes exist in the system."
+        )
+    
+    # Only link to an existing patient when the client chose one; people
+    # with the same name must not share a history
+    if consultation.patient_id is not None:
+        patient = get_patient(db, consultation.patient_id, doctor_id=doctor_id)
+    else:
+        patient = _add_patient(db, doctor_id, consultation.patient_name)
+    
+    # Create consultation
+    db_consultation = models.Consultation(
+        doctor_id=doctor_id,
+        patient_id=patient.id,
+        patient_name=consultation.patient_name,
+        consultation_date=consultation.consultation_date,
+        notes=consultation.notes
+    )
+    db.add(db_consultation)
+    db.flush()  # Get the consultation ID
+    
+    # Add diagnosis codes
+    for diagnosis_code in valid_codes:
+        consultation_diagnosis = models.ConsultationDiagnosis(
+            consultation_id=db_consultation.id,
+            diagnosis_code_id=diagnosis_code.id
+        )
+        db.add(consultation_diagnosis)
+    db.flush()
+    
+    return db_consultation
+
+def _apply_consultation(
+    db: Session,
+    consultation: schemas.ConsultationCreate,
+    doctor_id: int
+) -> int:
+    """Add a consultation for the group-commit writer, returning its ID"""
+    return _add_consultation(db, consultation, doctor_id).id
+
+consultation_writer = GroupCommitWriter(
+    apply=_apply_consultation,
+    name="consultation-writer"
+)
+
+def create_consultation(
+    db: Session, 
+    consultation: schemas.ConsultationCreate, 
+    doctor_id: int
+) -> int:
+    """
+    Create a new consultation with associated diagnosis codes and return
+    its ID once committed.
+    
+    When the group-commit writer is running the consultation is committed
+    together with other concurrent submissions; otherwise it is committed
+    on `db` directly. Load it with `get_consultation`; a failure to load it
+    then does not hide that it was saved.
+    """
+    try:
+        try:
+            consultation_id = consultation_writer.submit(consultation, doctor_id)
+        except WriterNotRunning:
+            consultation_id = _add_consultation(db, consultation, doctor_id).id
+            db.commit()
+        invalidation.publish(invalidation.CONSULTATIONS_CHANGED, doctor_id)
+        return consultation_id
         
     except NotFoundException:
         db.rollback()
         raise
     except IntegrityError as e:
         db.rollback()
-        logger.error(f"Integrity error creating consultation: {str(e)}")
+        logger.error("Integrity error creating consultation: %s", e)
         raise DatabaseException("Failed to create consultation due to data integrity issue")
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Database error creating consultation: {str(e)}")
+        logger.error("Database error creating consultation: %s", e)
         raise DatabaseException("Failed to create consultation")
+    except FutureTimeoutError:
+        logger.error("Timed out waiting for group commit; consultation was not saved")
+        raise DatabaseException("Failed to create consultation")
+
+def _consultation_query(db: Session, include_notes: bool = True):
+    """Consultation query that eagerly loads the doctor and diagnoses"""
+    query = db.query(models.Consultation).options(
+        joinedload(models.Consultation.doctor).load_only(models.Doctor.full_name),
+        selectinload(models.Consultation.diagnoses).joinedload(
+            models.ConsultationDiagnosis.diagnosis_code
+        )
+    )
+    if not include_notes:
+        query = query.options(defer(models.Consultation.notes))
+    return query
 
 def get_consultations(
     db: Session, 
     doctor_id: Optional[int] = None,
     skip: int = 0, 
-    limit: int = 100
+    limit: int = 100,
+    include_notes: bool = True
 ) -> List[models.Consultation]:
     """Get consultations, optionally filtered by doctor"""
     try:
-        query = db.query(models.Consultation)
+        query = _consultation_query(db, include_notes)
         
         if doctor_id:
             query = query.filter(models.Consultation.doctor_id == doctor_id)
@@ -176,5 +367,86 @@ def get_consultations(
         return consultations
         
     except SQLAlchemyError as e:
-        logger.error(f"Database error getting consultations: {str(e)}")
-        raise DatabaseException("Failed to retrieve consultations")
\ No newline at end of file
+        logger.error("Database error getting consultations: %s", e)
+        raise DatabaseException("Failed to retrieve consultations")
+
+def count_consultations(db: Session, doctor_id: Optional[int] = None) -> int:
+    """Count consultations, optionally of one doctor"""
+    try:
+        query = db.query(func.count(models.Consultation.id))
+        if doctor_id:
+            query = query.filter(models.Consultation.doctor_id == doctor_id)
+        return query.scalar()
+    except SQLAlchemyError as e:
+        logger.error("Database error counting consultations: %s", e)
+        raise DatabaseException("Failed to count consultations")
+
+def get_consultation_summaries(
+    db: Session,
+    doctor_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    patient_id: Optional[int] = None
+) -> List[models.Consultation]:
+    """
+    Get consultations for list views without fetching full notes,
+    optionally only one patient's (their timeline).
+    
+    `notes` stays deferred; instead `notes_preview` holds the first
+    NOTES_PREVIEW_LENGTH + 1 characters (the extra one tells whether the
+    notes were cut off). Diagnoses load only their codes.
+    """
+    try:
+        query = db.query(models.Consultation).options(
+            load_only(
+                models.Consultation.id,
+                models.Consultation.patient_id,
+                models.Consultation.patient_name,
+                models.Consultation.consultation_date,
+                models.Consultation.created_at,
+                models.Consultation.doctor_id
+            ),
+            with_expression(
+                models.Consultation.notes_preview,
+                func.substr(models.Consultation.notes, 1, NOTES_PREVIEW_LENGTH + 1)
+            ),
+            joinedload(models.Consultation.doctor).load_only(models.Doctor.full_name),
+            selectinload(models.Consultation.diagnoses).load_only(
+                models.ConsultationDiagnosis.consultation_id,
+                models.ConsultationDiagnosis.diagnosis_code_id
+            ).joinedload(models.ConsultationDiagnosis.diagnosis_code).load_only(
+                models.DiagnosisCode.code
+            )
+        )
+        
+        if doctor_id:
+            query = query.filter(models.Consultation.doctor_id == doctor_id)
+        if patient_id:
+            query = query.filter(models.Consultation.patient_id == patient_id)
+        
+        return query.order_by(
+            models.Consultation.consultation_date.desc()
+        ).offset(skip).limit(limit).all()
+    
+    except SQLAlchemyError as e:
+        logger.error("Database error getting consultation summaries: %s", e)
+        raise DatabaseException("Failed to retrieve consultations")
+
+def get_consultation(
+    db: Session,
+    consultation_id: int,
+    doctor_id: Optional[int] = None
+) -> models.Consultation:
+    """Get a single consultation, optionally restricted to one doctor"""
+    try:
+        query = _consultation_query(db).filter(models.Consultation.id == consultation_id)
+        if doctor_id:
+            query = query.filter(models.Consultation.doctor_id == doctor_id)
+        consultation = query.first()
+    except SQLAlchemyError as e:
+        logger.error("Database error getting consultation: %s", e)
+        raise DatabaseException("Failed to retrieve consultation")
+    
+    if consultation is None:
+        raise NotFoundException(f"Consultation {consultation_id} not found")
+    return consultation
\ No newline at end of file
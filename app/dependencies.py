@@ -6,12 +6,15 @@ from app import models, auth
 
 security = HTTPBearer()
 
-async def get_current_doctor(
+def get_current_doctor(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> models.Doctor:
     """
-    Dependency to get the currently authenticated doctor from JWT token
+    Dependency to get the currently authenticated doctor from JWT token.
+    
+    Kept synchronous so FastAPI runs its blocking database query in the
+    threadpool instead of on the event loop.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -30,4 +30,9 @@ class NotFoundException(AppException):
 class DuplicateException(AppException):
     """Exception for duplicate resource errors"""
     def __init__(self, message: str = "Resource already exists"):
-        super().__init__(message, status_code=409)
\ No newline at end of file
+        super().__init__(message, status_code=409)
+
+class ServiceUnavailableException(AppException):
+    """Exception for temporarily unavailable dependencies"""
+    def __init__(self, message: str = "Service temporarily unavailable"):
+        super().__init__(message, status_code=503)
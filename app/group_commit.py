@@ -0,0 +1,176 @@
+"""Group commit for high-rate writes
+
+Callers hand their write to a GroupCommitWriter and block on a future. A
+background thread collects pending writes into small batches (up to
+GROUP_COMMIT_MAX_BATCH items or GROUP_COMMIT_MAX_WAIT_MS milliseconds) and
+commits each batch in one transaction, so concurrent writers share a single
+commit instead of paying for one each.
+
+Each write runs inside its own SAVEPOINT, so a write that fails (e.g. an
+unknown diagnosis code) only fails its own caller. A caller's future is
+resolved only after the transaction holding its write has committed, so the
+durability guarantee is the same as committing alone.
+"""
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from typing import Any, Callable, List, Optional, Tuple
+from app.database import create_dedicated_engine
+from app.exceptions import DatabaseException
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "32"))
+GROUP_COMMIT_MAX_WAIT_MS = float(os.getenv("GROUP_COMMIT_MAX_WAIT_MS", "5"))
+# Longest a caller waits for its write before giving up
+GROUP_COMMIT_TIMEOUT_S = float(os.getenv("GROUP_COMMIT_TIMEOUT_S", "30"))
+
+# Sentinel telling the writer thread to drain and exit
+_STOP = object()
+
+class WriterNotRunning(RuntimeError):
+    """The writer is not accepting writes; the caller should commit its own"""
+
+class GroupCommitWriter:
+    """
+    Batches writes into shared transactions.
+
+    `apply(db, *args)` adds one write to the session without committing and
+    returns a plain value for the caller, such as the new row's ID. It is
+    handed over once the write has committed, so it must not need the
+    writer's session; callers reload what they need on their own.
+    """
+    def __init__(
+        self,
+        apply: Callable[..., Any],
+        name: str = "group-commit",
+        max_batch: int = GROUP_COMMIT_MAX_BATCH,
+        max_wait_ms: float = GROUP_COMMIT_MAX_WAIT_MS
+    ):
+        self.apply = apply
+        self.name = name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._engine: Optional[Engine] = None
+        self._session_factory: Optional[sessionmaker] = None
+        # Guards `_accepting` so nothing is queued behind the stop sentinel
+        self._lock = threading.Lock()
+        self._accepting = False
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._engine = create_dedicated_engine()
+        self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self._engine)
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        with self._lock:
+            self._accepting = True
+
+    def stop(self) -> None:
+        """Commit everything already queued, then stop the writer thread"""
+        if self._thread is None:
+            return
+        with self._lock:
+            self._accepting = False
+            self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        self._engine.dispose()
+        self._engine = None
+        self._session_factory = None
+
+    def submit(self, *args) -> Any:
+        """
+        Queue a write and wait until it has been committed.
+        
+        Raises WriterNotRunning if the writer is stopped or was never
+        started, and concurrent.futures.TimeoutError only if the write was
+        still queued after GROUP_COMMIT_TIMEOUT_S and has been withdrawn, so
+        it will never commit. A write already being committed is waited for.
+        """
+        future: Future = Future()
+        with self._lock:
+            if not self._accepting:
+                raise WriterNotRunning(f"{self.name} is not running")
+            self._queue.put((args, future))
+        try:
+            return future.result(timeout=GROUP_COMMIT_TIMEOUT_S)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise
+            # Already in a batch: report its real outcome, not a failure
+            logger.warning("Group commit slower than %ss; waiting for its outcome", GROUP_COMMIT_TIMEOUT_S)
+            return future.result()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch: List[Tuple[tuple, Future]]) -> None:
+        db = self._session_factory()
+        try:
+            written: List[Tuple[Any, Future]] = []
+            for args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                savepoint = db.begin_nested()
+                try:
+                    result = self.apply(db, *args)
+                    savepoint.commit()
+                    written.append((result, future))
+                except Exception as e:
+                    savepoint.rollback()
+                    future.set_exception(e)
+            if not written:
+                db.rollback()
+                return
+            try:
+                db.commit()
+            except Exception as e:
+                # Same outcome as each caller's own commit failing
+                db.rollback()
+                logger.error("Group commit of %d writes failed: %s", len(written), e)
+                for _, future in written:
+                    future.set_exception(e)
+                return
+            logger.debug("Group-committed %d of %d queued writes", len(written), len(batch))
+            for result, future in written:
+                future.set_result(result)
+        except Exception as e:
+            logger.error("Group commit batch failed: %s", e, exc_info=True)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(DatabaseException())
+        finally:
+            db.close()
@@ -0,0 +1,273 @@
+"""Cross-process cache invalidation bus
+
+Each worker process keeps its own in-memory caches. When one worker changes
+data behind a cache it publishes an event here; the event is handled locally
+straight away and broadcast to every other worker, which runs the same
+handlers.
+
+Backends (selected with INVALIDATION_BUS):
+
+- ``local``: in-process only, for a single worker (default)
+- ``postgres``: Postgres LISTEN/NOTIFY on the application database
+- ``socket``: Unix datagram sockets in INVALIDATION_SOCKET_DIR, for tests
+  and hosts without Postgres
+
+Handlers receive the event key (e.g. a doctor ID), or None when the bus may
+have missed events and every cache for that event should be dropped.
+"""
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from sqlalchemy import text
+from sqlalchemy.engine import Engine, make_url
+from typing import Callable, Dict, List, Optional
+import glob
+import json
+import logging
+import os
+import select
+import socket
+import sys
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_BUS = os.getenv("INVALIDATION_BUS", "local")
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "clinic_invalidation")
+INVALIDATION_SOCKET_DIR = os.getenv("INVALIDATION_SOCKET_DIR", "/tmp/clinic-invalidation")
+
+# Event types
+DOCTOR_CHANGED = "doctor_changed"
+CATALOG_CHANGED = "catalog_version"
+CONSULTATIONS_CHANGED = "consultations_changed"
+EVENTS = (DOCTOR_CHANGED, CATALOG_CHANGED, CONSULTATIONS_CHANGED)
+
+Handler = Callable[[Optional[str]], None]
+
+class InvalidationBus:
+    """In-process bus; subclasses add a transport to other processes"""
+    def __init__(self):
+        self._nonce = uuid.uuid4().hex[:8]
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+
+    @property
+    def broadcasts(self) -> bool:
+        """Whether events reach other processes"""
+        return False
+
+    @property
+    def origin(self) -> str:
+        # Includes the PID so workers forked from a preloaded app differ
+        return f"{os.getpid()}-{self._nonce}"
+
+    def subscribe(self, event: str, handler: Handler) -> None:
+        self._handlers[event].append(handler)
+
+    def publish(self, event: str, key: Optional[object] = None) -> None:
+        """Handle an event locally, then broadcast it to other workers"""
+        key = None if key is None else str(key)
+        self.dispatch(event, key)
+        try:
+            self._broadcast(json.dumps({"event": event, "key": key, "origin": self.origin}))
+        except Exception as e:
+            logger.error("Failed to broadcast %s event: %s", event, e)
+
+    def dispatch(self, event: str, key: Optional[str]) -> None:
+        for handler in self._handlers.get(event, ()):
+            try:
+                handler(key)
+            except Exception as e:
+                logger.error("Invalidation handler for %s failed: %s", event, e)
+
+    def dispatch_all(self) -> None:
+        """Drop every cache, used when events may have been missed"""
+        for event in EVENTS:
+            self.dispatch(event, None)
+
+    def _receive(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed invalidation payload")
+            return
+        if message.get("origin") == self.origin:
+            return
+        self.dispatch(message.get("event"), message.get("key"))
+
+    def _broadcast(self, payload: str) -> None:
+        pass
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+class _ListenerBus(InvalidationBus, ABC):
+    """Bus with a background thread receiving events from other workers"""
+    def __init__(self):
+        super().__init__()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def broadcasts(self) -> bool:
+        return True
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._listen, name="invalidation-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    @abstractmethod
+    def _listen(self) -> None:
+        """Receive events from other workers until stopped"""
+
+class PostgresBus(_ListenerBus):
+    """Broadcast events with Postgres LISTEN/NOTIFY"""
+    def __init__(self, database_url: str, channel: str = INVALIDATION_CHANNEL):
+        super().__init__()
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        self.channel = channel
+        self._engine: Optional[Engine] = None
+        self._engine_lock = threading.Lock()
+
+    def stop(self) -> None:
+        super().stop()
+        with self._engine_lock:
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+
+    def _broadcast(self, payload: str) -> None:
+        # Publishers usually still hold a pool connection in their request's
+        # session, so notifications go over a connection of their own
+        with self._engine_lock:
+            if self._engine is None:
+                from app.database import create_dedicated_engine
+                self._engine = create_dedicated_engine()
+            engine = self._engine
+        with engine.connect() as connection:
+            connection.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": payload}
+            )
+            connection.commit()
+
+    def _listen(self) -> None:
+        import psycopg2
+
+        reconnecting = False
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(self.dsn)
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN "{self.channel}"')
+                if reconnecting:
+                    # Anything published while we were disconnected is lost
+                    self.dispatch_all()
+                reconnecting = True
+                while not self._stop.is_set():
+                    if select.select([connection], [], [], 1.0)[0]:
+                        connection.poll()
+                        while connection.notifies:
+                            self._receive(connection.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error("Invalidation listener lost its connection: %s", e)
+                self._stop.wait(1.0)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+class SocketBus(_ListenerBus):
+    """Broadcast events over Unix datagram sockets in a shared directory"""
+    def __init__(self, directory: str = INVALIDATION_SOCKET_DIR):
+        super().__init__()
+        self.directory = directory
+        self.path: Optional[str] = None
+        self._socket: Optional[socket.socket] = None
+
+    def start(self) -> None:
+        if self._socket is None:
+            self.path = os.path.join(self.directory, f"{self.origin}.sock")
+            os.makedirs(self.directory, exist_ok=True)
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._socket.bind(self.path)
+            self._socket.settimeout(1.0)
+        super().start()
+
+    def stop(self) -> None:
+        super().stop()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.path = None
+
+    def _broadcast(self, payload: str) -> None:
+        data = payload.encode("utf-8")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            for path in glob.glob(os.path.join(self.directory, "*.sock")):
+                if path == self.path:
+                    continue
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Socket left behind by a worker that has exited
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def _listen(self) -> None:
+        while not self._stop.is_set():
+            try:
+                data = self._socket.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if not self._stop.is_set():
+                    logger.error("Invalidation socket closed unexpectedly: %s", e)
+                return
+            self._receive(data.decode("utf-8"))
+
+def create_bus(kind: str = INVALIDATION_BUS) -> InvalidationBus:
+    if kind == "postgres":
+        from app.database import DATABASE_URL
+        return PostgresBus(DATABASE_URL)
+    if kind == "socket":
+        return SocketBus()
+    if kind != "local":
+        logger.warning("Unknown INVALIDATION_BUS %r, using local bus", kind)
+    return InvalidationBus()
+
+bus = create_bus()
+
+def subscribe(event: str, handler: Handler) -> None:
+    bus.subscribe(event, handler)
+
+def publish(event: str, key: Optional[object] = None) -> None:
+    bus.publish(event, key)
+
+if __name__ == "__main__":
+    # e.g. `python -m app.invalidation catalog_version` after editing diagnosis codes
+    if len(sys.argv) < 2 or sys.argv[1] not in EVENTS:
+        sys.exit(f"usage: python -m app.invalidation {{{','.join(EVENTS)}}} [key]")
+    if not bus.broadcasts:
+        sys.exit(f"INVALIDATION_BUS is {INVALIDATION_BUS!r}, so no running worker would receive the event")
+    publish(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,183 @@
+"""Per-doctor cache of the first consultation list pages
+
+Most list traffic is doctors reopening the consultations page, which asks
+for the same first page every time. The rendered JSON of the first pages
+(up to LIST_CACHE_DEPTH records in) and the doctor's total consultation
+count are kept per doctor, so a repeat request is a dictionary lookup.
+
+A doctor's entries are dropped whenever a consultation of theirs is
+committed (the CONSULTATIONS_CHANGED event, which reaches other workers
+through the invalidation bus). Each doctor has a generation number that
+invalidation bumps; a page computed before an invalidation is not stored
+after it, so a slow request cannot put back a stale page.
+
+Backends (selected with LIST_CACHE_BACKEND):
+
+- ``memory``: in-process LRU over doctors, bounded by LIST_CACHE_MAX_BYTES
+  (default)
+- ``none``: no caching
+- ``package.module:Class``: any ListCacheBackend subclass, e.g. one backed
+  by a store shared between processes
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional, Tuple
+from app import invalidation
+import importlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LIST_CACHE_BACKEND = os.getenv("LIST_CACHE_BACKEND", "memory")
+# Doctors kept in the in-memory backend; the least recently used are evicted
+LIST_CACHE_MAX_DOCTORS = int(os.getenv("LIST_CACHE_MAX_DOCTORS", "1024"))
+# Pages kept per doctor (different views, limits or field selections)
+LIST_CACHE_MAX_PAGES = int(os.getenv("LIST_CACHE_MAX_PAGES", "8"))
+# Total size of cached pages per worker; least recently used doctors are
+# evicted first
+LIST_CACHE_MAX_BYTES = int(os.getenv("LIST_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Only pages starting before this many records are cached
+LIST_CACHE_DEPTH = int(os.getenv("LIST_CACHE_DEPTH", "100"))
+# Upper bound on staleness if consultations change outside the application
+LIST_CACHE_TTL_S = float(os.getenv("LIST_CACHE_TTL_S", "60"))
+
+# Key of the doctor's total consultation count
+TOTAL_COUNT_KEY = "total_count"
+
+class CachedPage(NamedTuple):
+    """A rendered list page and the consultation IDs on it (for auditing)"""
+    body: bytes
+    ids: Tuple[int, ...]
+
+def _size(value: Any) -> int:
+    """Approximate bytes held by a cache entry"""
+    if isinstance(value, CachedPage):
+        return len(value.body) + 8 * len(value.ids)
+    return 64
+
+class ListCacheBackend:
+    """
+    Storage for per-doctor cache entries. This base class caches nothing;
+    subclasses store entries.
+
+    `set` must store the value only while the doctor's generation still
+    equals `generation`, and `invalidate` must bump the generation.
+    """
+    def generation(self, doctor_id: int) -> int:
+        return 0
+
+    def get(self, doctor_id: int, key: Hashable) -> Optional[Any]:
+        return None
+
+    def set(self, doctor_id: int, key: Hashable, value: Any, generation: int) -> bool:
+        return False
+
+    def invalidate(self, doctor_id: Optional[int] = None) -> None:
+        """Drop one doctor's entries, or every doctor's if `doctor_id` is None"""
+        pass
+
+class MemoryListCacheBackend(ListCacheBackend):
+    """In-process backend, LRU-bounded by total bytes, doctors and pages per doctor"""
+    def __init__(
+        self,
+        max_bytes: int = LIST_CACHE_MAX_BYTES,
+        max_doctors: int = LIST_CACHE_MAX_DOCTORS,
+        max_pages: int = LIST_CACHE_MAX_PAGES,
+        ttl_s: float = LIST_CACHE_TTL_S
+    ):
+        self.max_bytes = max_bytes
+        self.max_doctors = max_doctors
+        self.max_pages = max_pages
+        self.ttl_s = ttl_s
+        # doctor_id -> key -> (expires_at, value), both in least recently used order
+        self._entries: "OrderedDict[int, OrderedDict[Hashable, Tuple[float, Any]]]" = OrderedDict()
+        self._bytes = 0
+        # Kept for evicted doctors too, so an in-flight page for them is still checked
+        self._generations: Dict[int, int] = {}
+        self._global_generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self, doctor_id: int) -> int:
+        with self._lock:
+            return self._global_generation + self._generations.get(doctor_id, 0)
+
+    def get(self, doctor_id: int, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            pages = self._entries.get(doctor_id)
+            if pages is None or key not in pages:
+                return None
+            expires_at, value = pages[key]
+            if expires_at < time.monotonic():
+                self._drop_page(pages, key)
+                return None
+            pages.move_to_end(key)
+            self._entries.move_to_end(doctor_id)
+            return value
+
+    def set(self, doctor_id: int, key: Hashable, value: Any, generation: int) -> bool:
+        size = _size(value)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if generation != self._global_generation + self._generations.get(doctor_id, 0):
+                return False
+            pages = self._entries.get(doctor_id)
+            if pages is None:
+                pages = self._entries[doctor_id] = OrderedDict()
+            elif key in pages:
+                self._drop_page(pages, key)
+            pages[key] = (time.monotonic() + self.ttl_s, value)
+            self._bytes += size
+            self._entries.move_to_end(doctor_id)
+            if len(pages) > self.max_pages:
+                self._drop_page(pages, next(iter(pages)))
+            # Evict whole doctors, least recently used first
+            while len(self._entries) > self.max_doctors or self._bytes > self.max_bytes:
+                self._drop_doctor(next(iter(self._entries)))
+            return doctor_id in self._entries
+
+    def invalidate(self, doctor_id: Optional[int] = None) -> None:
+        with self._lock:
+            if doctor_id is None:
+                self._global_generation += 1
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._generations[doctor_id] = self._generations.get(doctor_id, 0) + 1
+                self._drop_doctor(doctor_id)
+
+    def _drop_page(self, pages: "OrderedDict[Hashable, Tuple[float, Any]]", key: Hashable) -> None:
+        _, value = pages.pop(key)
+        self._bytes -= _size(value)
+
+    def _drop_doctor(self, doctor_id: int) -> None:
+        pages = self._entries.pop(doctor_id, None)
+        if pages:
+            self._bytes -= sum(_size(value) for _, value in pages.values())
+
+def create_backend(kind: str = LIST_CACHE_BACKEND) -> ListCacheBackend:
+    if kind == "memory":
+        return MemoryListCacheBackend()
+    if kind == "none":
+        return ListCacheBackend()
+    if ":" in kind:
+        module_name, _, class_name = kind.partition(":")
+        backend_class = getattr(importlib.import_module(module_name), class_name)
+        if not (isinstance(backend_class, type) and issubclass(backend_class, ListCacheBackend)):
+            raise TypeError(f"LIST_CACHE_BACKEND {kind!r} is not a ListCacheBackend")
+        return backend_class()
+    logger.warning("Unknown LIST_CACHE_BACKEND %r, caching disabled", kind)
+    return ListCacheBackend()
+
+list_cache = create_backend()
+
+def cacheable(skip: int) -> bool:
+    """Whether a page starting at `skip` is one of the cached first pages"""
+    return skip < LIST_CACHE_DEPTH
+
+def _on_consultations_changed(doctor_id: Optional[str]) -> None:
+    list_cache.invalidate(None if doctor_id is None else int(doctor_id))
+
+invalidation.subscribe(invalidation.CONSULTATIONS_CHANGED, _on_consultations_changed)
@@ -0,0 +1,123 @@
+"""Non-blocking structured logging for the application
+
+Log records are pushed onto an in-memory queue by the request thread and
+written to stderr as JSON lines by a background listener thread, so log I/O
+never sits on a request's critical path.
+"""
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of INFO records from sampled loggers that are kept (1.0 keeps all)
+LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
+# Upper bound on queued records; further records are dropped rather than blocking
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Loggers whose INFO output is high volume and safe to sample
+SAMPLED_LOGGERS = ("app.access", "app.routers", "app.crud")
+
+# Request ID of the request currently being handled, if any
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_listener: Optional[QueueListener] = None
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as single-line JSON objects"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+                  + ".%03dZ" % record.msecs,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        duration_ms = getattr(record, "duration_ms", None)
+        if duration_ms is not None:
+            entry["duration_ms"] = duration_ms
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request ID to every record"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+class InfoSamplingFilter(logging.Filter):
+    """Keep only a fraction of INFO-and-below records from high-volume loggers"""
+    def __init__(self, rate: float, prefixes=SAMPLED_LOGGERS):
+        super().__init__()
+        self.rate = rate
+        self.prefixes = prefixes
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno > logging.INFO:
+            return True
+        if not record.name.startswith(self.prefixes):
+            return True
+        return random.random() < self.rate
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full"""
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message here so arguments are not shared across threads,
+        # but leave JSON serialisation to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def setup_logging() -> None:
+    """Route root logging through a queue to a background JSON writer"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(InfoSamplingFilter(LOG_INFO_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the background writer"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
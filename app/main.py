@@ -1,23 +1,83 @@
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from pydantic import ValidationError
-from app.routers import auth, diagnosis, consultation
+from app.routers import auth, diagnosis, consultation, patient
 from app.exceptions import AppException
+from app.logging_config import setup_logging, shutdown_logging, request_id_var
+from app import warmup, invalidation, crud, audit
+from app.group_commit import GROUP_COMMIT_ENABLED
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
 import logging
+import os
+import re
+import time
+import uuid
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # brotli is optional; gzip is always available
+    BrotliMiddleware = None
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("app.access")
+
+# Client-supplied request IDs are echoed, logged and audited, so only short
+# plain ones are accepted
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm pools, mappers, schemas and the diagnosis catalog before serving
+    invalidation.bus.start()
+    await run_in_threadpool(warmup.warm_up)
+    if not warmup.state.ready:
+        # Serve /health and /ready meanwhile; /ready turns 200 once a retry succeeds
+        warmup.start_retrying()
+    audit.audit_log.start()
+    if GROUP_COMMIT_ENABLED:
+        crud.consultation_writer.start()
+    yield
+    warmup.stop_retrying()
+    # Commit any queued consultations, then flush their audit events
+    await run_in_threadpool(crud.consultation_writer.stop)
+    await run_in_threadpool(audit.audit_log.stop)
+    invalidation.bus.stop()
+    shutdown_logging()
 
 app = FastAPI(
     title="ClinicCare Medical Consultation API",
     description="API for managing medical consultation notes",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+@app.middleware("http")
+async def request_context_middleware(request: Request, call_next):
+    """Tag each request with an ID and log its duration"""
+    request_id = request.headers.get("X-Request-ID", "")
+    if not REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        response.headers["X-Request-ID"] = request_id
+        access_logger.info(
+            "%s %s %d", request.method, request.url.path, response.status_code,
+            extra={"duration_ms": duration_ms}
+        )
+        return response
+    finally:
+        request_id_var.reset(token)
+
 # CORS middleware for Vue frontend
 app.add_middleware(
     CORSMiddleware,
@@ -32,14 +92,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],
 )
 
+# Compress responses larger than this many bytes (brotli if the client accepts it, else gzip)
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1000"))
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+
 # Global exception handlers
 
 @app.exception_handler(AppException)
 async def app_exception_handler(request: Request, exc: AppException):
     """Handle custom application exceptions"""
-    logger.error(f"Application error: {exc.message}")
+    logger.error("Application error: %s", exc.message)
     return JSONResponse(
         status_code=exc.status_code,
         content={
@@ -57,7 +125,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         message = error["msg"]
         errors.append(f"{field}: {message}")
     
-    logger.warning(f"Validation error: {errors}")
+    logger.warning("Validation error: %s", errors)
     return JSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content={
@@ -69,7 +137,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 @app.exception_handler(ValidationError)
 async def pydantic_validation_exception_handler(request: Request, exc: ValidationError):
     """Handle Pydantic ValidationError"""
-    logger.warning(f"Pydantic validation error: {exc.errors()}")
+    logger.warning("Pydantic validation error: %s", exc.errors())
     return JSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content={
@@ -81,7 +149,7 @@ async def pydantic_validation_exception_handler(request: Request, exc: Validatio
 @app.exception_handler(IntegrityError)
 async def integrity_error_handler(request: Request, exc: IntegrityError):
     """Handle database integrity errors (unique constraints, foreign keys, etc.)"""
-    logger.error(f"Database integrity error: {str(exc)}")
+    logger.error("Database integrity error: %s", exc)
     
     error_msg = str(exc.orig) if hasattr(exc, 'orig') else str(exc)
     
@@ -105,7 +173,7 @@ async def integrity_error_handler(request: Request, exc: IntegrityError):
 @app.exception_handler(SQLAlchemyError)
 async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
     """Handle general SQLAlchemy errors"""
-    logger.error(f"Database error: {str(exc)}")
+    logger.error("Database error: %s", exc)
     return JSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={"detail": "Database operation failed. Please try again later."}
@@ -114,7 +182,7 @@ async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle all other unexpected exceptions"""
-    logger.error(f"Unexpected error: {str(exc)}", exc_info=True)
+    logger.error("Unexpected error: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={"detail": "An unexpected error occurred. Please try again later."}
@@ -124,6 +192,7 @@ async def general_exception_handler(request: Request, exc: Exception):
 app.include_router(auth.router)
 app.include_router(diagnosis.router)
 app.include_router(consultation.router)
+app.include_router(patient.router)
 
 @app.get("/")
 def read_root():
@@ -135,4 +204,20 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/ready")
+def readiness_check():
+    """Report ready only once startup warm-up has completed"""
+    state = warmup.state
+    content = {
+        "status": "ready" if state.ready else "not ready",
+        "startup_ms": state.total_ms,
+        "steps_ms": state.timings_ms
+    }
+    if state.error:
+        content["error"] = state.error
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if state.ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=content
+    )
\ No newline at end of file
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, Date, Boolean, ForeignKey, TIMESTAMP
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, Boolean, ForeignKey, TIMESTAMP, Identity
+from sqlalchemy.orm import relationship, query_expression
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -29,17 +29,38 @@ class DiagnosisCode(Base):
     # parent is ConsultationDiagnosis
     consultation_diagnoses = relationship("ConsultationDiagnosis", back_populates="diagnosis_code")
 
+# a doctor's patient; several patients may share a name
+class Patient(Base):
+    __tablename__ = "patients"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id", ondelete="CASCADE"), nullable=False)
+    # spelling from the first consultation recorded for the patient
+    name = Column(String(255), nullable=False)
+    # normalised name for searching (see crud.normalise_patient_name)
+    name_key = Column(String(255), nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    # loaded by crud queries, to tell same-name patients apart
+    consultation_count = query_expression()
+    last_visit = query_expression()
+    
+    consultations = relationship("Consultation", back_populates="patient")
+
 class Consultation(Base):
     __tablename__ = "consultations"
     
     id = Column(Integer, primary_key=True, index=True)
     doctor_id = Column(Integer, ForeignKey("doctors.id", ondelete="CASCADE"))
+    patient_id = Column(Integer, ForeignKey("patients.id"))
     patient_name = Column(String(255), nullable=False)
     consultation_date = Column(Date, nullable=False)
     notes = Column(Text)
     created_at = Column(TIMESTAMP, server_default=func.now())
+    # populated only by queries that ask for it (see crud.get_consultation_summaries)
+    notes_preview = query_expression()
     
     doctor = relationship("Doctor", back_populates="consultations")
+    patient = relationship("Patient", back_populates="consultations")
     # if consultation is deleted, delete all related consultationdiagnosis to it
     diagnoses = relationship("ConsultationDiagnosis", back_populates="consultation", cascade="all, delete-orphan")
 
@@ -52,4 +73,17 @@ class ConsultationDiagnosis(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     
     consultation = relationship("Consultation", back_populates="diagnoses")
-    diagnosis_code = relationship("DiagnosisCode", back_populates="consultation_diagnoses")
\ No newline at end of file
+    diagnosis_code = relationship("DiagnosisCode", back_populates="consultation_diagnoses")
+
+# append-only; partitioned by month in Postgres (see init.sql)
+class AccessAuditLog(Base):
+    __tablename__ = "access_audit_log"
+    __table_args__ = {"postgresql_partition_by": "RANGE (occurred_at)"}
+    
+    id = Column(BigInteger, Identity(always=True), primary_key=True)
+    occurred_at = Column(TIMESTAMP, primary_key=True, nullable=False)
+    # no foreign keys, so the trail outlives the rows it describes
+    doctor_id = Column(Integer, nullable=False)
+    action = Column(String(20), nullable=False)
+    consultation_id = Column(Integer, nullable=False)
+    request_id = Column(String(64))
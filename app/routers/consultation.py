@@ -1,16 +1,31 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
-from typing import List
-from app import crud, schemas, models
+from typing import List, Literal, Optional, Set, Union
+from app import crud, schemas, models, audit, serializers
 from app.database import get_db
 from app.dependencies import get_current_doctor
-from app.exceptions import NotFoundException, ValidationException
+from app.exceptions import NotFoundException, ValidationException, ServiceUnavailableException
+from app.list_cache import list_cache, cacheable, CachedPage, TOTAL_COUNT_KEY
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/consultation", tags=["Consultation"])
 
+def _parse_fields(fields: Optional[str], model) -> Optional[Set[str]]:
+    """Parse a comma-separated `fields` parameter against a schema's fields"""
+    if not fields:
+        return None
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected - set(model.model_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return selected
+
 @router.post("", response_model=schemas.ConsultationResponse, status_code=status.HTTP_201_CREATED)
 def create_consultation(
     consultation: schemas.ConsultationCreate,
@@ -37,28 +52,19 @@ def create_consultation(
     The consultation will be linked to the currently logged-in doctor.
     """
     try:
-        db_consultation = crud.create_consultation(db, consultation, current_doctor.id)
+        # Hold audit buffer space first: once committed, the write must not fail
+        with audit.reserve(1) as reservation:
+            consultation_id = crud.create_consultation(db, consultation, current_doctor.id)
+            reservation.record(current_doctor.id, audit.CREATE, [consultation_id])
+        
+        db_consultation = crud.get_consultation(db, consultation_id, doctor_id=current_doctor.id)
         
         # Format response with diagnosis details
-        response = schemas.ConsultationResponse(
-            id=db_consultation.id,
-            patient_name=db_consultation.patient_name,
-            consultation_date=db_consultation.consultation_date,
-            notes=db_consultation.notes,
-            doctor_name=current_doctor.full_name,
-            created_at=db_consultation.created_at,
-            diagnoses=[
-                schemas.ConsultationDiagnosisResponse(
-                    code=cd.diagnosis_code.code,
-                    description=cd.diagnosis_code.description
-                )
-                for cd in db_consultation.diagnoses
-            ]
-        )
+        response = serializers.consultation_response(db_consultation, current_doctor.full_name)
         
         logger.info(
-            f"Consultation created: ID={db_consultation.id}, "
-            f"Doctor={current_doctor.email}, Patient={consultation.patient_name}"
+            "Consultation created: id=%s doctor_id=%s",
+            db_consultation.id, current_doctor.id
         )
         return response
         
@@ -72,17 +78,24 @@ def create_consultation(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=str(e)
         )
+    except ServiceUnavailableException:
+        raise
     except Exception as e:
-        logger.error(f"Error creating consultation: {str(e)}")
+        logger.error("Error creating consultation: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create consultation"
         )
 
-@router.get("", response_model=List[schemas.ConsultationResponse])
+@router.get(
+    "",
+    response_model=Union[List[schemas.ConsultationResponse], List[schemas.ConsultationSummary]]
+)
 def list_consultations(
     skip: int = Query(0, ge=0, description="Number of records to skip for pagination"),
     limit: int = Query(100, ge=1, le=100, description="Maximum number of records to return (1-100)"),
+    view: Literal["full", "summary"] = Query("full", description="Full records or list summaries"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,patient_name"),
     current_doctor: models.Doctor = Depends(get_current_doctor),
     db: Session = Depends(get_db)
 ):
@@ -92,48 +105,127 @@ def list_consultations(
     Returns consultations in reverse chronological order (newest first).
     Supports pagination with skip and limit parameters.
     
-    Each consultation includes:
+    With `view=full` (default), each consultation includes:
     - Patient information
     - Consultation date and notes
     - Doctor who created it
     - All associated diagnosis codes with descriptions
     
+    With `view=summary`, each consultation has a notes preview of up to 200
+    characters (`notes_truncated` tells whether there is more) and only the
+    diagnosis codes. Use `GET /consultation/{id}` for the full record.
+    
+    `fields` limits each item to the listed fields of the chosen view.
+    
+    The `X-Total-Count` header gives the doctor's total number of
+    consultations. The first pages are served from a per-doctor cache that
+    is dropped whenever the doctor saves a consultation.
+    
     Requires valid JWT token in Authorization header.
     """
+    model = schemas.ConsultationSummary if view == "summary" else schemas.ConsultationResponse
+    selected = _parse_fields(fields, model)
     try:
+        # The first pages are served from the per-doctor cache when possible
+        use_cache = cacheable(skip)
+        page_key = (view, skip, limit, tuple(sorted(selected)) if selected is not None else None)
+        if use_cache:
+            page = list_cache.get(current_doctor.id, page_key)
+            total = list_cache.get(current_doctor.id, TOTAL_COUNT_KEY)
+            if page is not None and total is not None:
+                audit.record(current_doctor.id, audit.VIEW, page.ids)
+                return Response(
+                    content=page.body,
+                    media_type="application/json",
+                    headers={"X-Total-Count": str(total)}
+                )
+            # Read before querying, so a write committed meanwhile is not cached over
+            generation = list_cache.generation(current_doctor.id)
+        
         # Get consultations for current doctor only
-        consultations = crud.get_consultations(
-            db, 
-            doctor_id=current_doctor.id, 
-            skip=skip, 
-            limit=limit
-        )
+        if view == "summary":
+            consultations = crud.get_consultation_summaries(
+                db,
+                doctor_id=current_doctor.id,
+                skip=skip,
+                limit=limit
+            )
+            response = [serializers.consultation_summary(consultation) for consultation in consultations]
+        else:
+            include_notes = selected is None or "notes" in selected
+            consultations = crud.get_consultations(
+                db, 
+                doctor_id=current_doctor.id, 
+                skip=skip, 
+                limit=limit,
+                include_notes=include_notes
+            )
+            response = [
+                serializers.consultation_response(consultation, consultation.doctor.full_name, include_notes)
+                for consultation in consultations
+            ]
+        total = list_cache.get(current_doctor.id, TOTAL_COUNT_KEY) if use_cache else None
+        if total is None:
+            total = crud.count_consultations(db, doctor_id=current_doctor.id)
         
-        # Format response
-        response = []
-        for consultation in consultations:
-            response.append(schemas.ConsultationResponse(
-                id=consultation.id,
-                patient_name=consultation.patient_name,
-                consultation_date=consultation.consultation_date,
-                notes=consultation.notes,
-                doctor_name=consultation.doctor.full_name,
-                created_at=consultation.created_at,
-                diagnoses=[
-                    schemas.ConsultationDiagnosisResponse(
-                        code=cd.diagnosis_code.code,
-                        description=cd.diagnosis_code.description
-                    )
-                    for cd in consultation.diagnoses
-                ]
-            ))
+        ids = tuple(item.id for item in response)
+        audit.record(current_doctor.id, audit.VIEW, ids)
         
-        logger.info(f"Retrieved {len(response)} consultations for doctor {current_doctor.email}")
-        return response
+        logger.info("Retrieved %d consultations for doctor_id=%s", len(response), current_doctor.id)
+        rendered = JSONResponse(
+            content=[item.model_dump(mode="json", include=selected) for item in response],
+            headers={"X-Total-Count": str(total)}
+        )
+        if use_cache:
+            list_cache.set(
+                current_doctor.id, page_key, CachedPage(rendered.body, ids), generation
+            )
+            list_cache.set(current_doctor.id, TOTAL_COUNT_KEY, total, generation)
+        return rendered
         
+    except ServiceUnavailableException:
+        raise
     except Exception as e:
-        logger.error(f"Error retrieving consultations: {str(e)}")
+        logger.error("Error retrieving consultations: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to retrieve consultations"
-        )
\ No newline at end of file
+        )
+
+@router.get("/{consultation_id}", response_model=schemas.ConsultationResponse)
+def get_consultation(
+    consultation_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,notes"),
+    current_doctor: models.Doctor = Depends(get_current_doctor),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the full record of one of the current doctor's consultations.
+    
+    Returns 404 if the consultation does not exist or belongs to another doctor.
+    
+    Requires valid JWT token in Authorization header.
+    """
+    selected = _parse_fields(fields, schemas.ConsultationResponse)
+    try:
+        consultation = crud.get_consultation(db, consultation_id, doctor_id=current_doctor.id)
+        audit.record(current_doctor.id, audit.VIEW, [consultation.id])
+        
+        response = serializers.consultation_response(consultation, current_doctor.full_name)
+        if selected is not None:
+            return JSONResponse(content=response.model_dump(mode="json", include=selected))
+        return response
+    
+    except NotFoundException as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except ServiceUnavailableException:
+        raise
+    except Exception as e:
+        logger.error("Error retrieving consultation %s: %s", consultation_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve consultation"
+        )
@@ -52,8 +52,8 @@ def search_diagnosis(
         results = crud.search_diagnosis_codes(db, search_term)
         
         logger.info(
-            f"Diagnosis search by {current_doctor.email}: "
-            f"'{search_term}' returned {len(results)} results"
+            "Diagnosis search by doctor_id=%s: %r returned %d results",
+            current_doctor.id, search_term, len(results)
         )
         
         return results
@@ -61,8 +61,45 @@ def search_diagnosis(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error searching diagnosis codes: {str(e)}")
+        logger.error("Error searching diagnosis codes: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to search diagnosis codes"
-        )
\ No newline at end of file
+        )
+
+@router.post("/resolve", response_model=schemas.DiagnosisResolveResponse)
+def resolve_diagnosis_codes(
+    request: schemas.DiagnosisResolveRequest,
+    current_doctor: models.Doctor = Depends(get_current_doctor),
+    db: Session = Depends(get_db)
+):
+    """
+    Resolve many diagnosis codes in one request.
+    
+    Codes are matched exactly after trimming and uppercasing, and duplicates
+    are ignored. Returns the codes that exist with their descriptions, and
+    the codes that do not, both in request order.
+    
+    Example request body:
+    {
+        "codes": ["A00", "b05", "ZZ9"]
+    }
+    
+    Requires authentication with valid JWT token.
+    """
+    try:
+        found, unknown = crud.resolve_diagnosis_codes(db, request.codes)
+        
+        logger.info(
+            "Diagnosis resolve by doctor_id=%s: %d found, %d unknown",
+            current_doctor.id, len(found), len(unknown)
+        )
+        
+        return {"found": found, "unknown": unknown}
+        
+    except Exception as e:
+        logger.error("Error resolving diagnosis codes: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to resolve diagnosis codes"
+        )
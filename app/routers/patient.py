@@ -0,0 +1,113 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import List
+from app import crud, schemas, models, audit, serializers
+from app.database import get_db
+from app.dependencies import get_current_doctor
+from app.exceptions import NotFoundException, ServiceUnavailableException
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/patient", tags=["Patient"])
+
+@router.get("", response_model=List[schemas.Patient])
+def search_patients(
+    search: str = Query(
+        ...,
+        min_length=1,
+        max_length=100,
+        description="Part of the patient's name"
+    ),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of patients to return (1-100)"),
+    current_doctor: models.Doctor = Depends(get_current_doctor),
+    db: Session = Depends(get_db)
+):
+    """
+    Search the current doctor's patients by name.
+    
+    Case, punctuation and extra spaces are ignored, so "doe john" finds
+    "Doe, John". Close misspellings (e.g. "Jon Doe") also match, best
+    matches first. Different patients with the same name are listed
+    separately; pass the chosen `id` as `patient_id` when creating a
+    consultation to add it to that patient's history.
+    
+    Requires valid JWT token in Authorization header.
+    """
+    try:
+        search_term = search.strip()
+        if not search_term:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Search term cannot be empty"
+            )
+        
+        results = crud.search_patients(db, search_term, doctor_id=current_doctor.id, limit=limit)
+        
+        logger.info(
+            "Patient search by doctor_id=%s returned %d results",
+            current_doctor.id, len(results)
+        )
+        return results
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error searching patients: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to search patients"
+        )
+
+@router.get("/{patient_id}/consultations", response_model=schemas.PatientHistory)
+def get_patient_history(
+    patient_id: int,
+    skip: int = Query(0, ge=0, description="Number of records to skip for pagination"),
+    limit: int = Query(500, ge=1, le=500, description="Maximum number of records to return (1-500)"),
+    current_doctor: models.Doctor = Depends(get_current_doctor),
+    db: Session = Depends(get_db)
+):
+    """
+    Get a patient's consultation timeline with the current doctor.
+    
+    Returns consultations newest first, in the same summary form as
+    `GET /consultation?view=summary`. Returns 404 if the patient does not
+    exist or is another doctor's.
+    
+    Requires valid JWT token in Authorization header.
+    """
+    try:
+        patient = crud.get_patient(db, patient_id, doctor_id=current_doctor.id)
+        consultations = crud.get_consultation_summaries(
+            db,
+            doctor_id=current_doctor.id,
+            patient_id=patient.id,
+            skip=skip,
+            limit=limit
+        )
+        response = schemas.PatientHistory(
+            patient=patient,
+            consultations=[serializers.consultation_summary(consultation) for consultation in consultations]
+        )
+        
+        audit.record(current_doctor.id, audit.VIEW, [item.id for item in response.consultations])
+        
+        logger.info(
+            "Retrieved %d consultations of patient_id=%s for doctor_id=%s",
+            len(response.consultations), patient_id, current_doctor.id
+        )
+        return response
+    
+    except NotFoundException as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except ServiceUnavailableException:
+        raise
+    except Exception as e:
+        logger.error("Error retrieving history of patient %s: %s", patient_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve patient history"
+        )
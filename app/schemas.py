@@ -52,6 +52,32 @@ class DiagnosisCode(DiagnosisCodeBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
 
+def _check_diagnosis_code(code: str) -> None:
+    """Reject blank codes and codes outside the ICD-10 length range"""
+    if not code or not code.strip():
+        raise ValueError('Diagnosis codes cannot be empty')
+    if len(code.strip()) < 2 or len(code.strip()) > 10:
+        raise ValueError(f'Invalid diagnosis code format: {code}')
+
+class DiagnosisResolveRequest(BaseModel):
+    codes: List[str] = Field(
+        ...,
+        min_length=1,
+        max_length=5000,
+        description="Diagnosis codes to look up (up to 5000, each 2-10 characters)"
+    )
+    
+    @field_validator('codes')
+    @classmethod
+    def codes_must_be_valid_format(cls, v):
+        for code in v:
+            _check_diagnosis_code(code)
+        return v
+
+class DiagnosisResolveResponse(BaseModel):
+    found: List[DiagnosisCode]
+    unknown: List[str]
+
 # Consultation Schemas
 class ConsultationDiagnosisResponse(BaseModel):
     code: str
@@ -65,6 +91,11 @@ class ConsultationCreate(BaseModel):
         max_length=255, 
         description="Patient's full name"
     )
+    patient_id: Optional[int] = Field(
+        None,
+        description="Existing patient (from GET /patient) to add this consultation to; "
+                    "a new patient is created when omitted"
+    )
     consultation_date: date = Field(..., description="Date of consultation")
     notes: Optional[str] = Field(
         None, 
@@ -96,10 +127,7 @@ class ConsultationCreate(BaseModel):
     @classmethod
     def codes_must_be_valid_format(cls, v):
         for code in v:
-            if not code or not code.strip():
-                raise ValueError('Diagnosis codes cannot be empty')
-            if len(code.strip()) < 2 or len(code.strip()) > 10:
-                raise ValueError(f'Invalid diagnosis code format: {code}')
+            _check_diagnosis_code(code)
         # Remove duplicates while preserving order
         seen = set()
         unique_codes = []
@@ -112,10 +140,36 @@ class ConsultationCreate(BaseModel):
 
 class ConsultationResponse(BaseModel):
     id: int
+    patient_id: Optional[int] = None
     patient_name: str
     consultation_date: date
     notes: Optional[str] = None
     doctor_name: str
     diagnoses: List[ConsultationDiagnosisResponse]
     created_at: datetime
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class ConsultationSummary(BaseModel):
+    id: int
+    patient_id: Optional[int] = None
+    patient_name: str
+    consultation_date: date
+    notes_preview: Optional[str] = None
+    notes_truncated: bool = False
+    doctor_name: str
+    diagnosis_codes: List[str]
+    created_at: datetime
+    model_config = ConfigDict(from_attributes=True)
+
+# Patient schemas
+class Patient(BaseModel):
+    id: int
+    name: str
+    # Distinguish patients who share a name
+    consultation_count: int
+    last_visit: Optional[date] = None
+    model_config = ConfigDict(from_attributes=True)
+
+class PatientHistory(BaseModel):
+    patient: Patient
+    consultations: List[ConsultationSummary]
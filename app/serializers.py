@@ -0,0 +1,45 @@
+"""Build API responses from loaded ORM objects, shared by the routers"""
+from app import crud, models, schemas
+
+def consultation_response(
+    consultation: models.Consultation,
+    doctor_name: str,
+    include_notes: bool = True
+) -> schemas.ConsultationResponse:
+    """
+    Build the full response for a consultation with its diagnoses loaded.
+    Pass include_notes=False when notes were deferred, so they are not
+    lazy-loaded one row at a time.
+    """
+    return schemas.ConsultationResponse(
+        id=consultation.id,
+        patient_id=consultation.patient_id,
+        patient_name=consultation.patient_name,
+        consultation_date=consultation.consultation_date,
+        notes=consultation.notes if include_notes else None,
+        doctor_name=doctor_name,
+        created_at=consultation.created_at,
+        diagnoses=[
+            schemas.ConsultationDiagnosisResponse(
+                code=cd.diagnosis_code.code,
+                description=cd.diagnosis_code.description
+            )
+            for cd in consultation.diagnoses
+        ]
+    )
+
+def consultation_summary(consultation: models.Consultation) -> schemas.ConsultationSummary:
+    """Build a list summary from a consultation loaded by crud.get_consultation_summaries"""
+    preview = consultation.notes_preview
+    truncated = preview is not None and len(preview) > crud.NOTES_PREVIEW_LENGTH
+    return schemas.ConsultationSummary(
+        id=consultation.id,
+        patient_id=consultation.patient_id,
+        patient_name=consultation.patient_name,
+        consultation_date=consultation.consultation_date,
+        notes_preview=preview[:crud.NOTES_PREVIEW_LENGTH] if truncated else preview,
+        notes_truncated=truncated,
+        doctor_name=consultation.doctor.full_name,
+        diagnosis_codes=[cd.diagnosis_code.code for cd in consultation.diagnoses],
+        created_at=consultation.created_at
+    )
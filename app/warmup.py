@@ -0,0 +1,147 @@
+"""Startup warm-up and readiness state
+
+Runs during application startup so the first real requests do not pay for
+connection setup, mapper configuration, schema compilation or catalog
+loading. `/ready` reports the outcome. If a step fails (e.g. the database is
+briefly unreachable), a background thread retries from that step with
+backoff until warm-up succeeds.
+"""
+from datetime import date, datetime
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from typing import Callable, Dict, Optional, Set
+from app import models, schemas
+from app.catalog import diagnosis_catalog, CATALOG_SNAPSHOT_PREBUILT
+from app.database import engine, SessionLocal, DB_POOL_MIN_SIZE
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Longest pause between warm-up attempts after a failure
+WARMUP_RETRY_MAX_S = float(os.getenv("WARMUP_RETRY_MAX_S", "30"))
+
+class WarmupState:
+    """Outcome of the startup warm-up, read by the readiness probe"""
+    def __init__(self):
+        self.ready = False
+        self.error: Optional[str] = None
+        self.timings_ms: Dict[str, float] = {}
+        self.completed: Set[str] = set()
+        self.attempts = 0
+
+    @property
+    def total_ms(self) -> float:
+        return round(sum(self.timings_ms.values()), 2)
+
+state = WarmupState()
+
+def _fill_pool():
+    """Open DB_POOL_MIN_SIZE connections at once so they stay in the pool"""
+    connections = []
+    try:
+        for _ in range(DB_POOL_MIN_SIZE):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+def _configure_mappers():
+    configure_mappers()
+
+def _load_catalog():
+    """Map the shared snapshot, building it unless the Gunicorn master already has"""
+    db = SessionLocal()
+    try:
+        diagnosis_catalog.load(db, rebuild=not CATALOG_SNAPSHOT_PREBUILT)
+    finally:
+        db.close()
+
+def _warm_schemas():
+    """Exercise the validators and serializers used on the hot paths"""
+    schemas.ConsultationCreate(
+        patient_name="Warm Up",
+        consultation_date=date.today(),
+        notes="warm-up",
+        diagnosis_codes=["A00"]
+    )
+    schemas.ConsultationResponse(
+        id=0,
+        patient_name="Warm Up",
+        consultation_date=date.today(),
+        notes=None,
+        doctor_name="Warm Up",
+        created_at=datetime.utcnow(),
+        diagnoses=[schemas.ConsultationDiagnosisResponse(code="A00", description="warm-up")]
+    ).model_dump_json()
+    entry = diagnosis_catalog.first()
+    if entry is not None:
+        schemas.DiagnosisCode.model_validate(entry).model_dump_json()
+
+def _trial_query():
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+        db.query(models.Consultation).order_by(
+            models.Consultation.consultation_date.desc()
+        ).limit(1).all()
+    finally:
+        db.close()
+
+STEPS: Dict[str, Callable[[], None]] = {
+    "pool": _fill_pool,
+    "mappers": _configure_mappers,
+    "catalog": _load_catalog,
+    "schemas": _warm_schemas,
+    "trial_query": _trial_query,
+}
+
+def warm_up() -> WarmupState:
+    """Run every step not yet completed, in order, recording how long each one took"""
+    state.attempts += 1
+    for name, step in STEPS.items():
+        if name in state.completed:
+            continue
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            state.error = f"{name}: {type(e).__name__}"
+            logger.error("Warm-up step %s failed (attempt %d): %s", name, state.attempts, e)
+            return state
+        finally:
+            state.timings_ms[name] = round((time.perf_counter() - start) * 1000, 2)
+        state.completed.add(name)
+    
+    state.error = None
+    state.ready = True
+    logger.info("Warm-up finished in %.2f ms: %s", state.total_ms, state.timings_ms)
+    return state
+
+_retry_stop = threading.Event()
+_retry_thread: Optional[threading.Thread] = None
+
+def _retry_until_ready() -> None:
+    delay = 1.0
+    while not state.ready and not _retry_stop.wait(delay):
+        warm_up()
+        delay = min(delay * 2, WARMUP_RETRY_MAX_S)
+
+def start_retrying() -> None:
+    """Keep retrying a failed warm-up in the background until it succeeds"""
+    global _retry_thread
+    if state.ready or _retry_thread is not None:
+        return
+    _retry_stop.clear()
+    _retry_thread = threading.Thread(target=_retry_until_ready, name="warmup-retry", daemon=True)
+    _retry_thread.start()
+
+def stop_retrying() -> None:
+    global _retry_thread
+    if _retry_thread is None:
+        return
+    _retry_stop.set()
+    _retry_thread.join(timeout=5)
+    _retry_thread = None
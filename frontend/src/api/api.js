@@ -19,12 +19,29 @@ export default {
     return axios.get('/diagnosis', { params: { search: searchTerm } })
   },
   
+  resolveDiagnosisCodes(codes) {
+    return axios.post('/diagnosis/resolve', { codes })
+  },
+  
   // Consultation
   createConsultation(data) {
     return axios.post('/consultation', data)
   },
   
-  getConsultations(skip = 0, limit = 100) {
-    return axios.get('/consultation', { params: { skip, limit } })
+  getConsultations(skip = 0, limit = 100, view = 'summary') {
+    return axios.get('/consultation', { params: { skip, limit, view } })
+  },
+  
+  getConsultation(id) {
+    return axios.get(`/consultation/${id}`)
+  },
+  
+  // Patient
+  searchPatients(searchTerm) {
+    return axios.get('/patient', { params: { search: searchTerm } })
+  },
+  
+  getPatientHistory(id) {
+    return axios.get(`/patient/${id}/consultations`)
   }
 }
\ No newline at end of file
@@ -0,0 +1,38 @@
+# Gunicorn settings for running the API with several Uvicorn workers.
+# Every value can be overridden with the environment variable next to it.
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Number of worker processes; "auto" uses one per CPU core
+_workers = os.getenv("WEB_CONCURRENCY", "1")
+workers = multiprocessing.cpu_count() if _workers == "auto" else int(_workers)
+
+# Seconds a worker gets to finish in-flight requests on restart/shutdown
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# Recycle workers periodically; jitter keeps them from restarting together
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+
+# Workers each hold their own caches, and even a single worker must hear
+# events published from other processes (e.g. `python -m app.catalog publish`)
+os.environ.setdefault("INVALIDATION_BUS", "postgres")
+
+def on_starting(server):
+    """Build the diagnosis catalog snapshot once for all workers to map"""
+    # Run in a subprocess so the master never imports the app or opens connections
+    result = subprocess.run([sys.executable, "-m", "app.catalog", "build"])
+    if result.returncode == 0:
+        os.environ["CATALOG_SNAPSHOT_PREBUILT"] = "1"
+    else:
+        server.log.warning("Diagnosis catalog snapshot build failed; workers will build it")
+
+accesslog = None
+errorlog = "-"
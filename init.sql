@@ -14,9 +14,32 @@ CREATE TABLE IF NOT EXISTS diagnosis_codes (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- must match crud.normalise_patient_name
+CREATE OR REPLACE FUNCTION patient_name_key(name TEXT) RETURNS TEXT AS $$
+    SELECT COALESCE(
+        NULLIF(btrim(regexp_replace(
+            regexp_replace(lower(name), '[^[:alnum:][:space:]]', '', 'g'),
+            '[[:space:]]+', ' ', 'g'
+        )), ''),
+        lower(btrim(name))
+    );
+$$ LANGUAGE sql IMMUTABLE;
+
+-- each doctor's patients; names are not unique, consultations link by id
+CREATE TABLE IF NOT EXISTS patients (
+    id SERIAL PRIMARY KEY,
+    doctor_id INTEGER NOT NULL REFERENCES doctors(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    name_key VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE IF NOT EXISTS consultations (
     id SERIAL PRIMARY KEY,
     doctor_id INTEGER REFERENCES doctors(id) ON DELETE CASCADE,
+    patient_id INTEGER REFERENCES patients(id),
     patient_name VARCHAR(255) NOT NULL,
     consultation_date DATE NOT NULL,
     notes TEXT,
@@ -30,6 +53,27 @@ CREATE TABLE IF NOT EXISTS consultation_diagnoses (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- who created and who viewed which consultation; see migrations/001_access_audit_log.sql
+CREATE TABLE IF NOT EXISTS access_audit_log (
+    id BIGINT GENERATED ALWAYS AS IDENTITY,
+    occurred_at TIMESTAMP NOT NULL,
+    doctor_id INTEGER NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    consultation_id INTEGER NOT NULL,
+    request_id VARCHAR(64),
+    PRIMARY KEY (id, occurred_at)
+) PARTITION BY RANGE (occurred_at);
+
+CREATE OR REPLACE FUNCTION reject_audit_log_change() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'access_audit_log is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER access_audit_log_append_only
+    BEFORE UPDATE OR DELETE ON access_audit_log
+    FOR EACH ROW EXECUTE FUNCTION reject_audit_log_change();
+
 -- Insert 100 ICD-10 codes (took only headers for simplicity)
 -- who knew 100 ICD-10 codes is not fully sequential?
 INSERT INTO diagnosis_codes (code, description) VALUES
@@ -137,7 +181,12 @@ INSERT INTO diagnosis_codes (code, description) VALUES
 CREATE INDEX idx_diagnosis_code ON diagnosis_codes(code);
 CREATE INDEX idx_diagnosis_description ON diagnosis_codes(description);
 CREATE INDEX idx_consultation_date ON consultations(consultation_date);
+CREATE INDEX idx_consultation_patient ON consultations(patient_id, consultation_date);
+CREATE INDEX idx_patient_doctor ON patients(doctor_id, name_key);
+CREATE INDEX idx_patient_name_trgm ON patients USING gin (name_key gin_trgm_ops);
 CREATE INDEX idx_doctor_email ON doctors(email);
+CREATE INDEX idx_audit_consultation ON access_audit_log(consultation_id, occurred_at);
+CREATE INDEX idx_audit_doctor ON access_audit_log(doctor_id, occurred_at);
 
 -- this is actually password123
 INSERT INTO doctors (email, full_name, hashed_password) VALUES
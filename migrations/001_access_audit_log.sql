@@ -0,0 +1,26 @@
+-- Append-only access audit trail, partitioned by month.
+-- Partitions are created by the application as needed (app/audit.py).
+-- Old months can be archived or dropped with DETACH/DROP of their partition.
+CREATE TABLE IF NOT EXISTS access_audit_log (
+    id BIGINT GENERATED ALWAYS AS IDENTITY,
+    occurred_at TIMESTAMP NOT NULL,
+    doctor_id INTEGER NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    consultation_id INTEGER NOT NULL,
+    request_id VARCHAR(64),
+    PRIMARY KEY (id, occurred_at)
+) PARTITION BY RANGE (occurred_at);
+
+CREATE INDEX IF NOT EXISTS idx_audit_consultation ON access_audit_log(consultation_id, occurred_at);
+CREATE INDEX IF NOT EXISTS idx_audit_doctor ON access_audit_log(doctor_id, occurred_at);
+
+CREATE OR REPLACE FUNCTION reject_audit_log_change() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'access_audit_log is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS access_audit_log_append_only ON access_audit_log;
+CREATE TRIGGER access_audit_log_append_only
+    BEFORE UPDATE OR DELETE ON access_audit_log
+    FOR EACH ROW EXECUTE FUNCTION reject_audit_log_change();
@@ -0,0 +1,53 @@
+-- Patient index: each doctor's patients, linked from consultations by id.
+-- Backfills patients from existing consultations.patient_name values; safe to re-run.
+--
+-- Consultations are only added to an existing patient when the client picks
+-- one (ConsultationCreate.patient_id); a name alone never links them, since
+-- different people share names. Old consultations only have a free-text
+-- name, so the backfill gives each its own patient, as the API would have.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- must match crud.normalise_patient_name
+CREATE OR REPLACE FUNCTION patient_name_key(name TEXT) RETURNS TEXT AS $$
+    SELECT COALESCE(
+        NULLIF(btrim(regexp_replace(
+            regexp_replace(lower(name), '[^[:alnum:][:space:]]', '', 'g'),
+            '[[:space:]]+', ' ', 'g'
+        )), ''),
+        lower(btrim(name))
+    );
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS patients (
+    id SERIAL PRIMARY KEY,
+    doctor_id INTEGER NOT NULL REFERENCES doctors(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    name_key VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_patient_doctor ON patients(doctor_id, name_key);
+CREATE INDEX IF NOT EXISTS idx_patient_name_trgm ON patients USING gin (name_key gin_trgm_ops);
+
+ALTER TABLE consultations ADD COLUMN IF NOT EXISTS patient_id INTEGER REFERENCES patients(id);
+
+-- Patient IDs are drawn up front so each consultation can be pointed at its
+-- own new patient. Only unlinked consultations are read, so a re-run creates
+-- no duplicates.
+WITH unlinked AS (
+    SELECT id AS consultation_id,
+        nextval(pg_get_serial_sequence('patients', 'id')) AS patient_id,
+        doctor_id, patient_name, created_at
+    FROM consultations
+    WHERE patient_id IS NULL AND doctor_id IS NOT NULL
+), created AS (
+    INSERT INTO patients (id, doctor_id, name, name_key, created_at)
+    SELECT patient_id, doctor_id, patient_name, patient_name_key(patient_name), created_at
+    FROM unlinked
+)
+UPDATE consultations
+SET patient_id = unlinked.patient_id
+FROM unlinked
+WHERE consultations.id = unlinked.consultation_id;
+
+CREATE INDEX IF NOT EXISTS idx_consultation_patient ON consultations(patient_id, consultation_date);